@@ -1,65 +1,157 @@
-# NumPy für numerische Operationen, z. B. Log-Renditen und Zufallsziehungen
+# NumPy für numerische Operationen, z. B. Log-Renditen und Zufallsziehungen
 # Pandas zur Arbeit mit Zeitreihen-Daten in DataFrame-Form
-import numpy as np
+# Numba kompiliert die Pfad-Berechnung zu parallelem Maschinencode
+import os
+import threading
 
-# Führt für jedes Asset eine Monte-Carlo-Simulation mit Bootstrapping durch
-# Führt pro Asset eine simulationsbasierte Zukunftsprojektion durch
-# Kernbaustein der Projektlogik: Grundlage für spätere Portfoliobewertung (gewichtete Pfade)
-def run_monte_carlo(prices, num_simulations=30, num_days=252):
-    """ 
-    Führt Monte Carlo Simulation mit Bootstrapping für jedes Asset durch.
+import numpy as np
+from numpy.random import SFC64, Generator
+from numba import config, get_num_threads, njit, prange
+
+# Streamlit ruft den Kernel aus Skript-Threads statt aus dem Haupt-Thread auf. Wird TBB dort zum ersten Mal
+# gestartet, beendet sich der Python-Prozess nicht mehr – daher OpenMP bzw. workqueue vor TBB bevorzugen.
+# Eine vom Nutzer gewählte Schicht oder Reihenfolge (NUMBA_THREADING_LAYER[_PRIORITY]) bleibt unangetastet.
+if config.THREADING_LAYER == 'default' and 'NUMBA_THREADING_LAYER_PRIORITY' not in os.environ:
+    config.THREADING_LAYER_PRIORITY = ['omp', 'workqueue', 'tbb']
+
+# Der Kernel gibt den GIL frei, mehrere Streamlit-Sitzungen könnten ihn also gleichzeitig betreten.
+# Die Schicht "workqueue" bricht dabei den Prozess ab; die Sperre serialisiert die Aufrufe
+# (ohne Verlust, da jeder Aufruf ohnehin alle Kerne nutzt)
+_KERNEL_LOCK = threading.Lock()
+
+
+# Numba-Kernel: simuliert alle Pfade eines Assets und mittelt sie in einer einzigen, fusionierten Schleife
+# Pro Simulation wird der Preis p in einem Skalar fortgeschrieben und direkt auf die Tagessummen addiert –
+# weder gezogene Renditen noch die einzelnen Pfade (Simulationen x Tage) werden als Array angelegt
+# Parallelisiert wird über Blöcke von Simulationen; jeder Block summiert in eine eigene Zeile von partial
+# nogil: der Kernel gibt den GIL frei, andere Python-Threads (z. B. der Streamlit-Server) laufen währenddessen weiter
+@njit(parallel=True, fastmath=True, cache=True, nogil=True)
+def _simulate_asset(growth, idx, out, num_blocks):
+    """
+    - growth: tägliche Wachstumsfaktoren exp(Log-Rendite) eines Assets (1-D, zusammenhängend)
+    - idx: Bootstrap-Indizes in growth, Form (Simulationen, Tage)
+    - out: vorab angelegtes Array der Länge Tage + 1, wird mit dem Durchschnittspfad befüllt
+    - num_blocks: Anzahl paralleler Blöcke (typischerweise die Anzahl der Numba-Threads)
+    """
+    num_sims, num_days = idx.shape
+    num_blocks = max(1, min(num_sims, num_blocks))
+    partial = np.zeros((num_blocks, num_days + 1))
+    for b in prange(num_blocks):
+        for i in range(b, num_sims, num_blocks):
+            # p hat den Datentyp der Wachstumsfaktoren (float32) und wird nicht auf float64 hochgestuft
+            p = growth.dtype.type(1.0)
+            partial[b, 0] += p
+            for j in range(num_days):
+                p *= growth[idx[i, j]]
+                partial[b, j + 1] += p
+    for j in range(num_days + 1):
+        out[j] = partial[:, j].sum() / num_sims
+
+
+# Einmaliges Aufwärmen beim Import, damit die erste echte Simulation nicht auf die Kompilierung wartet
+_simulate_asset(np.ones(1, dtype=np.float32), np.zeros((1, 1), dtype=np.int32), np.empty(2, dtype=np.float32), 1)
+
+
+# Hält die historischen Wachstumsfaktoren eines Assets und zieht daraus Bootstrap-Stichproben
+# Wird einmal pro Asset angelegt, sodass die Aufbereitung nicht für jede Ziehung wiederholt wird
+class BootstrapSampler:
+    def __init__(self, log_returns):
+        # Tägliche Wachstumsfaktoren werden nur einmal je historischer Rendite berechnet,
+        # statt exp() für jeden gezogenen Tag jeder Simulation aufzurufen
+        # float32 halbiert den Speicherbedarf und ist für die Pfadprojektion genau genug
+        self.growth = np.ascontiguousarray(np.exp(log_returns), dtype=np.float32)
+
+    def draw(self, rng, size):
+        """
+        Zieht Bootstrap-Indizes (mit Zurücklegen, gleichverteilt) in self.growth.
+        size ist z. B. (Simulationen, Tage). int32 halbiert den Speicherverkehr gegenüber int64.
+        """
+        return rng.integers(0, self.growth.size, size=size, dtype=np.int32)
+
+
+# Führt für jede Spalte eines Preis-Arrays eine Monte-Carlo-Simulation mit Bootstrapping durch
+# Arbeitet nur mit NumPy-Arrays, sodass Aufrufer ihre Daten ohne Pandas-Overhead übergeben können (z. B. die App)
+def simulate_prices(price_values, num_simulations=30, num_days=252, rng=None):
+    """
+    Array-Variante von run_monte_carlo (ohne DataFrame, Spalten werden über ihre Position identifiziert).
 
     Parameter:
-    - prices: DataFrame mit historischen Preisen (Spalten = Asset-Ticker, Zeilen = Zeitpunkte)
-    - num_simulations: Anzahl der zufällig gezogenen Pfade (Simulationen) pro Asset
-    - num_days: Anzahl der Tage, die jede Simulation umfassen soll (standardmäßig 1 Jahr = 252 Handelstage)
+    - price_values: NumPy-Array mit historischen Preisen (Zeilen = Zeitpunkte, Spalten = Assets), float32 oder float64
+    - num_simulations, num_days, rng: wie bei run_monte_carlo
 
     Rückgabe:
-    - Dictionary, in dem jedem Asset der durchschnittliche Pfad (numpy array) über alle Simulationen zugeordnet ist. 
+    - Liste der Spaltenpositionen, die simuliert wurden (Spalten ohne gültige Daten fehlen)
+    - Array (Assets x Tage + 1, float32) mit dem durchschnittlichen Pfad je simulierter Spalte
     """
 
-    # Berechnung täglicher Log-Renditen für alle Assets
-    log_returns = np.log(prices / prices.shift(1)).dropna()
-
-    # Speichert Simulationen je Asset
-    asset_paths = {}
+    # Berechnung täglicher Log-Renditen für alle Assets direkt auf dem NumPy-Array (ohne Pandas-Indexabgleich)
+    # Spalte t enthält die Rendite von Zeitpunkt t auf t+1; fehlende Preise ergeben NaN und werden je Asset gefiltert
+    # Einmalig transponiert (Assets x Zeitpunkte, C-Reihenfolge), damit jedes Asset ein zusammenhängender Zeilenblock ist
+    # Die Log-Renditen werden im Datentyp der Preise berechnet (float32 genügt, da die Wachstumsfaktoren ohnehin float32 sind)
+    price_values = np.asarray(price_values)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_returns = np.ascontiguousarray(np.log(price_values[1:] / price_values[:-1]).T)
+
+    # Zufallsgenerator für alle Ziehungen (einmalig erzeugt, nicht pro Asset)
+    # SFC64 erzeugt gleichverteilte Ganzzahlen schneller als der Standard-Generator (PCG64)
+    if rng is None:
+        rng = Generator(SFC64())
+
+    # Legt je Asset einmalig einen Sampler mit dessen historischen Renditen an
+    samplers = {}
+    for i in range(log_returns.shape[0]):
+
+        # Isolieren der gültigen Log-Renditen für das aktuelle Asset (zusammenhängende Zeile statt Spalte mit Schrittweite)
+        # NaNs werden nur in dieser Zeile entfernt – Lücken eines Assets kosten die anderen Assets keine Daten
+        asset_returns = log_returns[i]
+        asset_returns = asset_returns[np.isfinite(asset_returns)]
+
+        # Skippen, falls keine gültigen Daten vorhanden sind (z. B. wenn Asset nur NaNs enthält)
+        if asset_returns.size == 0:
+            continue
 
-    # Schleife über alle enthaltenen Assets
-    for asset in prices.columns:
+        samplers[i] = BootstrapSampler(asset_returns)
 
-        # Isolieren der Log-Renditen für das aktuelle Asset
-        asset_returns = log_returns[asset].dropna()
+    # Matrix der Durchschnittspfade (eine Zeile je simuliertem Asset)
+    positions = list(samplers)
+    avg_paths = np.empty((len(positions), num_days + 1), dtype=np.float32)
 
-        # Skippen, falls keine gültigen Daten vorhanden sind (z. B. wenn Asset nur NaNs enthält)
-        if asset_returns.empty:
-            continue
+    # Schleife über alle Assets mit gültigen Daten
+    for row, sampler in enumerate(samplers.values()):
 
-        # Liste zur Zwischenspeicherung aller Simulationen für das aktuelle Asset
-        simulations = []
+        # Ziehen von Tagesrenditen mit Zurücklegen (Bootstrapping) für alle Simulationen auf einmal
+        # Dadurch wird keine Verteilung angenommen, sondern aus realen historischen Daten geschätzt
+        idx = sampler.draw(rng, (num_simulations, num_days))
 
-        # Durchführung der Simulationen (z. B. 30 Pfade)
-        for _ in range(num_simulations):
+        # Berechnung des **durchschnittlichen Pfads** über alle Simulationen (Startwert 1.0, danach kumuliertes Produkt)
+        # Dieser Durchschnittspfad dient später als Basis für Portfolio-Simulation durch Gewichtung je Titel
+        # Der Kernel schreibt direkt in die Zeile des Assets
+        with _KERNEL_LOCK:
+            _simulate_asset(sampler.growth, idx, avg_paths[row], get_num_threads())
 
-            # Ziehen von Tagesrenditen mit Zurücklegen (Bootstrapping)
-            # Dadurch wird keine Verteilung angenommen, sondern aus realen historischen Daten geschätzt
-            sampled_returns = np.random.choice(asset_returns, size=num_days, replace=True)
+    return positions, avg_paths
 
-            # Transformation der Log-Renditen in Preisverläufe:
-            # exp(sampled_returns) → tägliche Wachstumsfaktoren
-            # cumprod() → Aufsummierung dieser Faktoren über die Zeit + insert() fügt den Startwert 1.0 ein
-            path = np.insert(np.cumprod(np.exp(sampled_returns)), 0, 1.0)
 
-            # Speichern des simulierten Pfads in der Liste
-            simulations.append(path)
+# Führt für jedes Asset eine Monte-Carlo-Simulation mit Bootstrapping durch
+# Führt pro Asset eine simulationsbasierte Zukunftsprojektion durch
+# Kernbaustein der Projektlogik: Grundlage für spätere Portfoliobewertung (gewichtete Pfade)
+def run_monte_carlo(prices, num_simulations=30, num_days=252, rng=None):
+    """
+    Führt Monte Carlo Simulation mit Bootstrapping für jedes Asset durch.
+    Pfade und Durchschnitt werden je Asset im Numba-Kernel _simulate_asset berechnet.
 
-        # Konvertierung der Liste in ein NumPy-Array und Zuordnung zum aktuellen Asset
-        asset_paths[asset] = np.array(simulations)
+    Parameter:
+    - prices: DataFrame mit historischen Preisen (Spalten = Asset-Ticker, Zeilen = Zeitpunkte)
+    - num_simulations: Anzahl der zufällig gezogenen Pfade (Simulationen) pro Asset
+    - num_days: Anzahl der Tage, die jede Simulation umfassen soll (standardmäßig 1 Jahr = 252 Handelstage)
+    - rng: optionaler NumPy-Generator (z. B. für reproduzierbare Ergebnisse), sonst wird ein neuer erzeugt
 
-    # Berechnung des **durchschnittlichen Pfads** je Asset über alle Simulationen
-    # Dieser Durchschnittspfad dient später als Basis für Portfolio-Simulation durch Gewichtung je Titel
-    asset_avg_path = {
-        asset: np.mean(paths, axis=0) for asset, paths in asset_paths.items()
-    }
+    Rückgabe:
+    - Liste der simulierten Asset-Ticker (Assets ohne gültige Daten fehlen)
+    - Array (Assets x Tage + 1, float32) mit dem durchschnittlichen Pfad je Asset über alle Simulationen,
+      Zeile i gehört zum i-ten Ticker der Liste
+    """
+    positions, avg_paths = simulate_prices(prices.to_numpy(dtype=np.float64), num_simulations, num_days, rng)
 
     # Rückgabe der geglätteten Erwartungspfade -> später für Visualisierung + Analyse
-    return asset_avg_path
+    return prices.columns[positions].tolist(), avg_paths
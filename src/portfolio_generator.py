@@ -12,91 +12,85 @@ def load_asset_allocation():
 def load_asset_list():
     return pd.read_csv('data/processed/asset_list.csv')
 
+# Verteilt das Zielgewicht einer Assetklasse für alle Portfolios gleichzeitig auf deren Assets
+# Zieht zufällige Aufteilungen aus einer Dirichlet-Verteilung und repariert anschließend Verletzungen von min_weight/max_weight
+def _draw_class_weights(rng, num_portfolios, num_assets, target, min_weight, max_weight, max_passes=10):
+    """
+    Gibt ein Array (Portfolios x Assets) zurück, dessen Zeilen sich (sofern erreichbar) zu target summieren.
+    Jedes Gewicht ist entweder 0 oder liegt zwischen min_weight und max_weight.
+    """
+
+    # Zufällige Aufteilung des Zielgewichts: jede Zeile summiert sich zu target
+    weights = rng.dirichlet(np.ones(num_assets), size=num_portfolios) * target
+
+    # Anzahl Assets, die mindestens besetzt bleiben müssen, damit target ohne Überschreitung von max_weight erreichbar ist
+    min_kept = max(1, int(np.ceil(target / max_weight - 1e-9)))
+    max_removed = max(num_assets - min_kept, 0)
+
+    for _ in range(max_passes):
+        # Assets unter dem Mindestgewicht fallen heraus (Gewicht 0) – jeweils die kleinsten zuerst,
+        # aber nur so viele, dass die Klasse ihr Zielgewicht noch erreichen kann
+        ranks = weights.argsort(axis=1).argsort(axis=1)
+        weights[(weights < min_weight) & (ranks < max_removed)] = 0
+
+        # Kappt Gewichte oberhalb des Maximalgewichts
+        np.minimum(weights, max_weight, out=weights)
+
+        # Verteilt das fehlende Gewicht proportional auf alle Assets, die noch Platz bis max_weight haben
+        free = (weights > 0) & (weights < max_weight)
+        missing = target - weights.sum(axis=1)
+        free_sum = np.where(free, weights, 0).sum(axis=1)
+        scale = np.ones(num_portfolios)
+        np.divide(missing, free_sum, out=scale, where=free_sum > 0)
+        scale[free_sum > 0] += 1
+        weights = np.where(free, weights * scale[:, None], weights)
+
+        # Fertig, sobald kein Gewicht mehr über dem Maximum liegt
+        if not (weights > max_weight + 1e-12).any():
+            break
+
+    return weights
+
 # Generiert eine große Anzahl zufälliger Portfolios auf Basis der Zielverteilung auf Assetklassen
 # Dabei wird sichergestellt, dass jedes Asset innerhalb einer Klasse ein realistisches Gewicht (zwischen min_weight und max_weight) erhält
 # Die Funktion wird im Projekt im Schritt 4 verwendet (vgl. Projekt Erklärung), wo aus 25 Assets 1000 zufällige Kombinationen erstellt werden
-def generate_portfolios(asset_allocation, assets_by_class, num_portfolios=1000, min_weight=0.025, max_weight=0.3):
+def generate_portfolios(asset_allocation, assets_by_class, num_portfolios=1000, min_weight=0.025, max_weight=0.3, rng=None):
     """
     Generiert zufällige Portfolios auf Basis der Zielgewichtung je Assetklasse.
-    Die Gewichte einzelner Assets werden zufällig verteilt, unter Einhaltung von min_weight/max_weight.
+    Die Gewichte einzelner Assets werden je Klasse für alle Portfolios auf einmal (Dirichlet-Verteilung) gezogen,
+    unter Einhaltung von min_weight/max_weight.
+    Über rng kann ein eigener NumPy-Generator übergeben werden (z. B. für reproduzierbare Ergebnisse).
     """
 
-    # Leere Liste zur Speicherung aller generierten Portfolios
-    portfolios = []
-
-    # Schleife über die gewünschte Anzahl an Portfolios
-    for _ in range(num_portfolios):
-        # Initialisiert ein leeres Portfolio (Dictionary), in das später Asset-Gewichte geschrieben werden
-        portfolio = {}
-
-        # Iteration über alle Assetklassen (z. B. 'Stocks', 'Bonds', 'ETFs') und deren Zielgewicht (z. B. 60%)
-        for asset_class, target_weight in asset_allocation.items():
-            # Holt sich die Liste der verfügbaren Titel in der aktuellen Klasse
-            assets = assets_by_class.get(asset_class, [])
-
-            # Überspringt die Klasse, falls keine Assets verfügbar sind oder das Zielgewicht 0 ist
-            if not assets or target_weight == 0:
-                continue
-
-            # Durchmischt die Liste zufällig, damit jedes Portfolio eine andere Reihenfolge bekommt
-            np.random.shuffle(assets)
-
-            # Initialisiert das aktuell zugewiesene Gewicht auf 0
-            assigned_weight = 0
-
-            # Erzeugt ein Dictionary mit allen Assets in der Klasse und setzt deren Gewicht auf 0
-            asset_weights = {asset: 0 for asset in assets}
-
-            # Solange das Zielgewicht noch nicht vollständig auf Assets verteilt wurde:
-            while assigned_weight < target_weight / 100:
-                # Berechnet, wie viel Gewicht noch zugewiesen werden muss
-                remaining_weight = (target_weight / 100) - assigned_weight
-
-                # Wenn das verbleibende Gewicht kleiner als das Minimum ist (z. B. < 2.5%)
-                if remaining_weight < min_weight:
-                    # Wählt nur Assets, die schon Gewicht bekommen haben und das Restgewicht noch vertragen können
-                    eligible_assets = [
-                        a for a in assets
-                        if asset_weights[a] > 0 and asset_weights[a] + remaining_weight <= max_weight
-                    ]
-                    # Wenn solche Assets existieren, wird eines zufällig gewählt und das Restgewicht zugewiesen
-                    if eligible_assets:
-                        selected = np.random.choice(eligible_assets)
-                        asset_weights[selected] += remaining_weight
-                        assigned_weight += remaining_weight
-                    # Danach wird die Schleife verlassen
-                    break
-
-                # Alle Assets, die noch unter dem Maximalgewicht liegen, sind wählbar
-                eligible_assets = [a for a in assets if asset_weights[a] < max_weight]
-
-                # Falls keine wählbaren Assets mehr vorhanden sind, bricht die Schleife ab
-                if not eligible_assets:
-                    break
-
-                # Wählt zufällig ein Asset aus der zulässigen Liste
-                selected = np.random.choice(eligible_assets)
-
-                # Bestimmt, wie viel noch maximal zugewiesen werden darf (nicht über max_weight)
-                max_assignable = min(max_weight - asset_weights[selected], remaining_weight)
-
-                # Zieht zufälliges Gewicht zwischen min_weight und dem maximal Zuweisbaren
-                weight = np.random.uniform(min_weight, max_assignable)
-
-                # Fügt dem ausgewählten Asset das Gewicht hinzu
-                asset_weights[selected] += weight
-                # Erhöht das zugewiesene Gesamtgewicht
-                assigned_weight += weight
-
-            # Fügt die Asset-Gewichte des aktuellen Assetklasse zum Portfolio hinzu
-            portfolio.update(asset_weights)
-
-        # Fügt das fertige Portfolio zur Liste aller Portfolios hinzu
-        portfolios.append(portfolio)
-
-    # Wandelt die Liste aus Dictionaries in einen DataFrame um
-    # Assets ohne Zuweisung erhalten 0
-    df_portfolios = pd.DataFrame(portfolios).fillna(0)
+    # Zufallsgenerator für alle Ziehungen (einmalig erzeugt, nicht pro Portfolio)
+    if rng is None:
+        rng = np.random.default_rng()
+
+    # Bestimmt einmalig die Assetklassen, die tatsächlich Gewicht erhalten, und die feste Spaltenreihenfolge
+    # Klassen ohne verfügbare Assets oder mit Zielgewicht 0 werden übersprungen
+    active_classes = [
+        (asset_class, target_weight, assets_by_class[asset_class])
+        for asset_class, target_weight in asset_allocation.items()
+        if assets_by_class.get(asset_class) and target_weight != 0
+    ]
+    all_assets = [asset for _, _, assets in active_classes for asset in assets]
+
+    # Vorab angelegte Gewichtsmatrix (Portfolios x Assets), Assets ohne Zuweisung behalten 0
+    weights = np.zeros((num_portfolios, len(all_assets)))
+
+    # Iteration über alle Assetklassen (z. B. 'Stocks', 'Bonds', 'ETFs') und deren Zielgewicht (z. B. 60%)
+    # Die Assets einer Klasse liegen als zusammenhängender Spaltenblock in der Matrix
+    offset = 0
+    for asset_class, target_weight, assets in active_classes:
+        # Ist das Zielgewicht kleiner als das Minimum (z. B. < 2.5%), bleiben alle Assets der Klasse bei 0
+        if target_weight / 100 >= min_weight:
+            weights[:, offset:offset + len(assets)] = _draw_class_weights(
+                rng, num_portfolios, len(assets), target_weight / 100, min_weight, max_weight
+            )
+        offset += len(assets)
+
+    # Wandelt die Matrix in einen DataFrame um (jede Zeile ist ein Portfolio, jede Spalte ein Asset)
+    df_portfolios = pd.DataFrame(weights, columns=all_assets)
 
     # Gibt den Portfolio-DataFrame zurück
     return df_portfolios
@@ -5,68 +5,56 @@ import pandas as pd
 # Funktion zur Analyse und Bewertung von simulierten Portfolios
 # Verwendet die durchschnittlichen Simulationspfade je Asset und gewichtet sie gemäß den Portfolio-Zusammensetzungen
 # Bewertet jedes Portfolio anhand von Total Return und Sharpe Ratio, gemäß Projekt-Schritt 6–7 (vgl. Projekt Erklärung)
-def analyze_simulation_results(asset_avg_paths, portfolios):
+def analyze_simulation_results(columns, asset_avg_paths, portfolios):
     """
     Nimmt durchschnittliche Asset-Pfade und berechnet daraus gewichtete Portfolio-Pfade.
     Bewertet alle Portfolios nach Total Return & Sharpe Ratio.
-    """
-
-    # Leere Liste zur Speicherung der Analyseergebnisse jedes Portfolios
-    records = []
-
-    # Iteriert über alle Portfolios im DataFrame (jede Zeile = ein Portfolio)
-    for portfolio_id, (_, weights_row) in enumerate(portfolios.iterrows()):
-        # Konvertiert die Gewichtungen der einzelnen Assets aus der aktuellen Zeile in ein Dictionary
-        weights = weights_row.to_dict()
 
-        # Bestimmt die Anzahl der Zeitschritte (Tage) anhand eines beliebigen Asset-Pfads
-        days = next(iter(asset_avg_paths.values())).shape[0]
-
-        # Initialisiert einen leeren Pfad (Numpy-Array) mit Nullen für den Gesamtverlauf des Portfolios
-        portfolio_path = np.zeros(days)
-
-        # Iteriert über alle Asset-Gewichte im aktuellen Portfolio
-        for asset, weight in weights.items():
-            # Nur wenn das Asset simuliert wurde (d. h. in asset_avg_paths vorhanden), wird es berücksichtigt
-            if asset in asset_avg_paths:
-                # Gewichteter Beitrag des Asset-Simulationspfads zum Gesamtportfolio
-                portfolio_path += weight * asset_avg_paths[asset]
+    columns und asset_avg_paths (Assets x Tage) entsprechen der Rückgabe von run_monte_carlo.
+    portfolios ist entweder ein DataFrame (Spalten = Ticker) oder eine bereits auf columns
+    ausgerichtete Gewichtsmatrix (Portfolios x Assets, NumPy-Array).
+    """
 
-        # Berechnet tägliche prozentuale Renditen aus dem Portfolioverlauf
-        returns = pd.Series(portfolio_path).pct_change().dropna()
+    # Pfad-Matrix P (Assets x Tage); P und W sind float32, damit die Matrixmultiplikation in einfacher Genauigkeit (sgemm) läuft
+    P = np.asarray(asset_avg_paths, dtype=np.float32)
 
-        # Gesamtperformance über den gesamten Simulationszeitraum (Endwert - Startwert relativ zum Start)
-        total_return = (portfolio_path[-1] - portfolio_path[0]) / portfolio_path[0]
+    # Gewichtsmatrix W (Portfolios x Assets) in derselben Asset-Reihenfolge wie P
+    # Nicht simulierte Assets sind nicht in columns enthalten und tragen damit nichts zum Portfolio bei
+    if isinstance(portfolios, pd.DataFrame):
+        W = portfolios.reindex(columns=columns, fill_value=0).to_numpy(dtype=np.float32)
+    else:
+        W = np.asarray(portfolios, dtype=np.float32)
 
-        # Berechnung der Sharpe Ratio als Maß für risikoadjustierte Rendite (Durchschnittsrendite / Volatilität)
-        # Der kleine Wert 1e-9 verhindert Division durch Null
-        sharpe_ratio = returns.mean() / (returns.std() + 1e-9)
+    # Berechnet alle gewichteten Portfolio-Pfade in einer einzigen Matrixmultiplikation (Portfolios x Tage)
+    all_paths = W @ P
 
-        # Fügt die Analyseergebnisse als Dictionary zur Recordliste hinzu
-        records.append({
-            "portfolio_id": portfolio_id,               # ID des Portfolios
-            "portfolio_path": portfolio_path.tolist(),  # Verlauf (für spätere Visualisierung)
-            "total_return": total_return,               # Gesamtrendite
-            "sharpe_ratio": sharpe_ratio,               # Risikoadjustierte Rendite
-            "weights": weights                          # Gewichtungen des Portfolios
-        })
+    # Berechnet tägliche prozentuale Renditen aller Portfolioverläufe (Portfolios x Tage-1)
+    returns = np.diff(all_paths, axis=1) / all_paths[:, :-1]
 
-    # Wandelt die Liste der Ergebnisse in einen DataFrame um
-    df = pd.DataFrame(records)
+    # Gesamtperformance über den gesamten Simulationszeitraum (Endwert - Startwert relativ zum Start)
+    total_returns = (all_paths[:, -1] - all_paths[:, 0]) / all_paths[:, 0]
 
-    # Speichert die Scores separat ab (vorbereitend für gewichtete Gesamtauswertung)
-    df["score_total_return"] = df["total_return"]
-    df["score_sharpe_ratio"] = df["sharpe_ratio"]
+    # Berechnung der Sharpe Ratio als Maß für risikoadjustierte Rendite (Durchschnittsrendite / Volatilität)
+    # ddof=1 entspricht der Stichproben-Standardabweichung, der kleine Wert 1e-9 verhindert Division durch Null
+    sharpe_ratios = returns.mean(axis=1) / (returns.std(axis=1, ddof=1) + 1e-9)
 
     # Kombinierter Score zur Gesamtbewertung: 90% Total Return + 10% Sharpe Ratio
-    df["final_score"] = (
-        0.9 * df["score_total_return"] + 0.1 * df["score_sharpe_ratio"]
-    )
+    final_scores = 0.9 * total_returns + 0.1 * sharpe_ratios
+
+    # Erstellt den Ergebnis-DataFrame in einem Schritt aus den Ergebnis-Arrays (eine Zeile je Portfolio)
+    df = pd.DataFrame({
+        "portfolio_id": np.arange(len(portfolios)),   # ID des Portfolios
+        "total_return": total_returns,                 # Gesamtrendite
+        "sharpe_ratio": sharpe_ratios,                 # Risikoadjustierte Rendite
+        "score_total_return": total_returns,           # Scores separat (für gewichtete Gesamtauswertung)
+        "score_sharpe_ratio": sharpe_ratios,
+        "final_score": final_scores                    # Kombinierter Score
+    })
 
     # Identifiziert das Portfolio mit dem höchsten kombinierten Score
-    best_row = df.loc[df["final_score"].idxmax()]
-    best_portfolio_id = int(best_row["portfolio_id"])           # ID des besten Portfolios
-    best_portfolio_path = best_row["portfolio_path"]            # Verlauf des besten Portfolios
+    # nanargmax ignoriert (wie zuvor idxmax) Portfolios ohne gültigen Score
+    best_portfolio_id = int(np.nanargmax(final_scores))        # ID des besten Portfolios
+    best_portfolio_path = all_paths[best_portfolio_id]          # Verlauf des besten Portfolios (Zeile der Pfad-Matrix)
 
     # Gibt zurück:
     # - den vollständigen DataFrame mit allen Portfolioergebnissen
@@ -2,15 +2,15 @@
 # - pandas: Für Datenmanipulation
 # - KMeans: Für Clustering zur Regime-Erkennung
 # - yahooquery: (nicht aktiv genutzt, vorgesehen für spätere Yahoo-Daten)
-# - pairwise_distances: Für Distanzberechnung zwischen Datenpunkten
 # - StandardScaler: Für Datenstandardisierung (wichtiger Schritt vor KMeans)
 # - numpy: Für numerische Operationen
+# - ThreadPoolExecutor: Für parallele Abfragen der Makrodaten
 import pandas as pd
 from sklearn.cluster import KMeans
-from sklearn.metrics import pairwise_distances
 from sklearn.preprocessing import StandardScaler
 import numpy as np
 import yfinance as yf
+from concurrent.futures import ThreadPoolExecutor
 
 
 # Lädt die historische Makroklassifikation aus einer CSV-Datei
@@ -25,8 +25,25 @@ def fetch_live_macro_data(fred_api_key):
     from fredapi import Fred
     fred = Fred(api_key=fred_api_key)
 
-    # Holt Zeitreihe des Verbraucherpreisindex (CPI) und berechnet daraus die Inflation als YoY-Veränderung
-    cpi_series = fred.get_series('CPIAUCSL').dropna()
+    # Holt eine FRED-Zeitreihe ohne fehlende Werte
+    def fetch_series(series_id):
+        return fred.get_series(series_id).dropna()
+
+    # Holt VIX-Daten der letzten Tage über yfinance (kein Fallback)
+    def fetch_vix():
+        return yf.download("^VIX", period="5d", interval="1d", progress=False)
+
+    # Startet alle Abfragen gleichzeitig, damit sich die Wartezeiten der HTTP-Anfragen überlappen
+    # Die Gesamtdauer entspricht so in etwa der langsamsten einzelnen Abfrage statt der Summe aller
+    series_ids = ['CPIAUCSL', 'UNRATE', 'A191RL1Q225SBEA', 'GS10', 'GS2']
+    with ThreadPoolExecutor(max_workers=len(series_ids) + 1) as executor:
+        series_futures = {series_id: executor.submit(fetch_series, series_id) for series_id in series_ids}
+        vix_future = executor.submit(fetch_vix)
+        series = {series_id: future.result() for series_id, future in series_futures.items()}
+        vix_data = vix_future.result()
+
+    # Berechnet aus der Zeitreihe des Verbraucherpreisindex (CPI) die Inflation als YoY-Veränderung
+    cpi_series = series['CPIAUCSL']
     latest_date = cpi_series.index.max()  # Aktuellster Eintrag
     cpi_now = cpi_series.loc[latest_date]
     one_year_ago = latest_date - pd.DateOffset(years=1)  # Datum vor einem Jahr
@@ -34,21 +51,20 @@ def fetch_live_macro_data(fred_api_key):
     cpi_old = cpi_series.iloc[nearest_idx]
     inflation = (cpi_now / cpi_old - 1) * 100  # Prozentuale Veränderung
 
-    # Holt aktuelle Arbeitslosenquote
-    unemployment = fred.get_series('UNRATE').dropna().iloc[-1]
+    # Aktuelle Arbeitslosenquote
+    unemployment = series['UNRATE'].iloc[-1]
 
-    # Holt letztes verfügbares reales BIP-Wachstum (annualisiert, Quartalswert)
-    gdp_growth = fred.get_series('A191RL1Q225SBEA').dropna().iloc[-1]
+    # Letztes verfügbares reales BIP-Wachstum (annualisiert, Quartalswert)
+    gdp_growth = series['A191RL1Q225SBEA'].iloc[-1]
 
-    # Holt aktuelle Treasury-Yields für 10 Jahre und 2 Jahre
-    treasury_yield_10y = fred.get_series('GS10').dropna().iloc[-1]
-    treasury_yield_2y = fred.get_series('GS2').dropna().iloc[-1]
+    # Aktuelle Treasury-Yields für 10 Jahre und 2 Jahre
+    treasury_yield_10y = series['GS10'].iloc[-1]
+    treasury_yield_2y = series['GS2'].iloc[-1]
 
     # Berechnet die Zinsstrukturkurve (10Y – 2Y), ein Indikator für mögliche Rezessionen
     yield_curve = treasury_yield_10y - treasury_yield_2y
 
-    # Holt aktuellen VIX-Wert über yfinance (kein Fallback)
-    vix_data = yf.download("^VIX", period="5d", interval="1d", progress=False)
+    # Letzter verfügbarer VIX-Wert
     vix_series = vix_data["Close"].dropna()
     vix = float(vix_series.iloc[-1])
 
@@ -67,38 +83,80 @@ def fetch_live_macro_data(fred_api_key):
     df = pd.DataFrame([latest_data])
     return df
 
-# Klassifiziert das aktuelle Marktregime basierend auf Live-Makrodaten im Vergleich zur historischen Klassifikation
-# Nutzt ein KMeans-Modell zur Clustereinteilung und weist anschließend ein Regime zu
-# Gibt das erkannte Regime und die drei ähnlichsten historischen Zeiträume zurück
-def classify_market_regime(live_macro_data, macro_classification):
-    # Definiert die verwendeten Features, die für die Klassifikation genutzt werden
-    features = ['Inflation', 'Unemployment', 'GDP_Growth', 'Yield_Curve_10Y_2Y', 'Treasury_10Y', 'Treasury_2Y', 'VIX']
+# Features, anhand derer aktuelle und historische Makrolagen verglichen werden
+MACRO_FEATURES = ['Inflation', 'Unemployment', 'GDP_Growth', 'Yield_Curve_10Y_2Y', 'Treasury_10Y', 'Treasury_2Y', 'VIX']
+
+# Bereitet das Regime-Modell aus der historischen Makroklassifikation vor (aufwendiger, aber seltener Schritt)
+# Das Ergebnis hängt nur von den historischen Daten ab und kann daher zwischengespeichert werden (z. B. st.cache_resource)
+def fit_regime_model(macro_classification):
+    """
+    Fittet den StandardScaler auf die historischen Makrodaten und skaliert diese.
+
+    Rückgabe:
+    - Tupel (scaler, historical_scaled, labels): gefitteter Scaler, skalierte historische Daten (schreibgeschützt)
+      und die zugehörigen Zeilen-Labels in macro_classification
+    """
 
     # Extrahiert nur die numerischen Daten aus der Klassifikation, ohne fehlende Werte
-    historical_data = macro_classification[features].dropna()
+    historical_data = macro_classification[MACRO_FEATURES].dropna()
 
-    # Standardisiert die Features (wichtig für Clustering, damit alle Features gleich gewichtet sind)
+    # Standardisiert die Features (wichtig für den Distanzvergleich, damit alle Features gleich gewichtet sind)
     scaler = StandardScaler()
-    historical_scaled = scaler.fit_transform(historical_data)  # Fit auf historische Daten
-    live_scaled = scaler.transform(live_macro_data[features])  # Transformation des Live-Datensatzes
+    historical_scaled = scaler.fit_transform(historical_data.to_numpy(dtype=np.float64))
 
-    # Berechnet die Distanz (Ähnlichkeit) aller historischen Punkte zum aktuellen Punkt
-    distances = pairwise_distances(historical_scaled, live_scaled)
+    # Schreibschutz, da das zwischengespeicherte Array bei jedem Aufruf wiederverwendet wird
+    historical_scaled.setflags(write=False)
 
-    # Sortiert die Indizes der 3 historisch ähnlichsten Zeitpunkte aufsteigend nach Distanz
-    sorted_indices = np.argsort(distances.flatten())[:3]
+    # Die Labels werden benötigt, da nach dropna() Position und Label nicht übereinstimmen müssen
+    return scaler, historical_scaled, historical_data.index
 
-    # Bestimme das Regime anhand der historisch ähnlichsten Periode (Index mit geringster Distanz)
-    regime = macro_classification.iloc[sorted_indices[0]]["Regime"]
+# Ordnet die aktuelle Makrolage mithilfe eines vorbereiteten Regime-Modells ein (günstiger Schritt bei jedem Aufruf)
+# Gibt das erkannte Regime und die drei ähnlichsten historischen Zeiträume zurück
+def predict_regime(model, live_macro_data, macro_classification):
+    """
+    Parameter:
+    - model: Rückgabe von fit_regime_model für dieselbe macro_classification
+    - live_macro_data: DataFrame mit einer Zeile aktueller Makrodaten
+    - macro_classification: historische Klassifikation (erhält die Spalte Distance für die Top-Treffer)
+
+    Rückgabe:
+    - erkanntes Regime und Liste der drei ähnlichsten historischen Perioden (Datum)
+    """
+    scaler, historical_scaled, labels = model
+
+    # Transformation des Live-Datensatzes mit dem bereits gefitteten Scaler
+    live_scaled = scaler.transform(live_macro_data[MACRO_FEATURES].to_numpy(dtype=np.float64))
+
+    # Berechnet die quadrierte euklidische Distanz (Ähnlichkeit) aller historischen Punkte zum aktuellen Punkt
+    # live_scaled hat die Form (1, Features) und wird per Broadcasting von jeder historischen Zeile abgezogen
+    # Für die Rangfolge genügt die quadrierte Distanz, die Wurzel wird nur für die 3 besten Treffer gezogen
+    diff = historical_scaled - live_scaled
+    d = np.einsum('ij,ij->i', diff, diff)
+
+    # Bestimmt die 3 historisch ähnlichsten Zeitpunkte ohne komplette Sortierung aller Distanzen:
+    # argpartition sucht die 3 kleinsten Werte, danach werden nur diese 3 aufsteigend sortiert
+    top_k = min(3, d.size)
+    part = np.argpartition(d, top_k - 1)[:top_k]
+    sorted_indices = part[np.argsort(d[part])]
+
+    # Übersetzt die Positionen in die Zeilen-Labels von macro_classification
+    top_labels = labels[sorted_indices]
 
-    # Liste zur Speicherung der drei ähnlichsten Zeitpunkte
-    top_periods = []
+    # Bestimme das Regime anhand der historisch ähnlichsten Periode (Index mit geringster Distanz)
+    regime = macro_classification.at[top_labels[0], "Regime"]
 
-    # Fügt die Distanzwerte in die macro_classification-Tabelle ein (optional, z. B. zur Visualisierung)
+    # Fügt die Distanzwerte in die macro_classification-Tabelle ein (optional, z. B. zur Visualisierung)
     macro_classification['Distance'] = np.nan
-    for idx in sorted_indices:
-        macro_classification.at[idx, 'Distance'] = distances.flatten()[idx]
-        top_periods.append(macro_classification.at[idx, 'Date']) 
+    macro_classification.loc[top_labels, 'Distance'] = np.sqrt(d[sorted_indices])
+
+    # Liste der drei ähnlichsten Zeitpunkte
+    top_periods = macro_classification.loc[top_labels, 'Date'].tolist()
 
     # Gibt das ermittelte Regime und die Liste der drei ähnlichsten historischen Perioden zurück
     return regime, top_periods
+
+# Klassifiziert das aktuelle Marktregime basierend auf Live-Makrodaten im Vergleich zur historischen Klassifikation
+# Kurzform für fit_regime_model + predict_regime (das Modell wird dabei jedes Mal neu vorbereitet)
+def classify_market_regime(live_macro_data, macro_classification):
+    model = fit_regime_model(macro_classification)
+    return predict_regime(model, live_macro_data, macro_classification)
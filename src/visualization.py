@@ -2,9 +2,11 @@
 # - matplotlib.pyplot für klassische Diagramme (z. B. Linienplots)
 # - plotly.graph_objects und plotly.express für interaktive Grafiken (z. B. Treemaps, Pie Charts)
 # - numpy für numerische Arrays, pandas für Tabellen, ast wird nicht genutzt
+# - lru_cache, um die Asset-Liste nur einmal einzulesen
 import plotly.graph_objects as go
 import plotly.express as px
 import pandas as pd
+from functools import lru_cache
 
 # Erstellt ein Kreisdiagramm (Pie Chart) für die Allokation nach Assetklassen (z. B. Aktien, Bonds etc.)
 # Wird im Projekt verwendet, um die Aufteilung der Strategien (z. B. konservativ) visuell darzustellen
@@ -83,20 +85,25 @@ def plot_monte_carlo(simulation_path):
     # Gibt die Visualisierung zurück
     return fig
 
+# Lädt die Asset-Liste einmalig und erstellt daraus die Mappings Ticker → Assetklasse und Ticker → Volltext-Name
+# Erwartet Spalten: Asset (Ticker), Class (Kategorie), FullName (Volltext-Name)
+# Das Ergebnis wird zwischengespeichert, damit die CSV nicht bei jedem Zeichnen der Treemap neu gelesen wird
+@lru_cache(maxsize=1)
+def _asset_maps():
+    asset_df = pd.read_csv('data/processed/asset_list.csv')
+    asset_class_map = dict(zip(asset_df['Asset'], asset_df['Class']))
+    asset_name_map = dict(zip(asset_df['Asset'], asset_df['FullName']))
+    return asset_class_map, asset_name_map
+
 # Erstellt eine interaktive Treemap zur Darstellung der Portfolio-Allokation
 # Die einzelnen Titel sind nach Assetklasse gruppiert dargestellt
 def plot_portfolio_allocation(portfolio: pd.Series):
     # Filtert Portfolio auf Positionen mit Gewicht > 0 und sortiert absteigend
     allocation = portfolio[portfolio > 0].sort_values(ascending=False)
 
-    # 📥 Lädt ergänzende Informationen aus CSV-Datei
-    # Erwartet Spalten: Asset (Ticker), Class (Kategorie), FullName (Volltext-Name)
-    asset_df = pd.read_csv('data/processed/asset_list.csv')
-
-    # Erstellt Mapping: Ticker → Assetklasse
-    asset_class_map = dict(zip(asset_df['Asset'], asset_df['Class']))
-    # Erstellt Mapping: Ticker → Volltext-Name
-    asset_name_map = dict(zip(asset_df['Asset'], asset_df['FullName']))
+    # 📥 Holt ergänzende Informationen aus der (zwischengespeicherten) Asset-Liste
+    # Mapping: Ticker → Assetklasse und Ticker → Volltext-Name
+    asset_class_map, asset_name_map = _asset_maps()
 
     # 📊 Treemap-Daten vorbereiten für jede Asset-Position im Portfolio
     treemap_data = []
@@ -146,14 +153,15 @@ def plot_portfolio_allocation(portfolio: pd.Series):
 
 # Visualisiert den durchschnittlichen Pfad jedes simulierten Assets als interaktives Liniendiagramm (Plotly)
 # Wird genutzt zur Qualitätsprüfung und zum Vergleich von Assetverläufen
-def plot_asset_averages(asset_averages):
+# columns und asset_averages (Assets x Tage) entsprechen der Rückgabe von run_monte_carlo
+def plot_asset_averages(columns, asset_averages):
     import plotly.graph_objects as go
 
     # Initialisiert eine neue Plotly-Figur
     fig = go.Figure()
 
-    # Fügt für jedes Asset eine Linie hinzu
-    for asset, path in asset_averages.items():
+    # Fügt für jedes Asset eine Linie hinzu (Zeile i der Matrix gehört zum i-ten Ticker)
+    for asset, path in zip(columns, asset_averages):
         fig.add_trace(go.Scatter(
             y=path,
             mode='lines',
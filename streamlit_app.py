@@ -3,24 +3,24 @@ import streamlit as st # Streamlit wird für die Benutzeroberfläche verwendet
 
 import pandas as pd # Pandas dient zur Datenverarbeitung in Tabellenform
 
+import numpy as np # NumPy für die Übergabe der Preisdaten als Array an die Simulation
+
 import os # Betriebssystemfunktionen – hier für Zugriff auf Umgebungsvariablen
 
 import yfinance as yf #Laden von Preisdaten über Yahoo
 
 from dotenv import load_dotenv # dotenv ermöglicht das Einlesen von API-Keys aus einer .env-Datei
 
-from datetime import datetime, timedelta #wird für Zeitberechnungen verwendet
-
 
 # === Projektinterne Module importieren ===
 # Makro-Datenabfrage, Regime-Erkennung und Klassifikation
-from src.utils import fetch_live_macro_data, load_macro_classification, classify_market_regime
+from src.utils import fetch_live_macro_data, load_macro_classification, fit_regime_model, predict_regime
 
 # Laden der Asset-Liste und Zuweisung der Allokationen, Portfoliogenerierung
 from src.portfolio_generator import load_asset_list, generate_portfolios, load_asset_allocation
 
 # Monte-Carlo-Modul zur Simulation von Preisentwicklungen auf Asset-Basis
-from src.monte_carlo import run_monte_carlo
+from src.monte_carlo import simulate_prices
 
 # Bewertungsmodul zur Berechnung von Scores, Sharpe Ratios etc.
 from src.simulation_analyzer import analyze_simulation_results
@@ -29,6 +29,134 @@ from src.simulation_analyzer import analyze_simulation_results
 from src.visualization import plot_allocation_pie, plot_monte_carlo, plot_portfolio_allocation, plot_asset_averages
 
 
+# === Zwischengespeicherte Datenabrufe ===
+# Streamlit führt das gesamte Skript bei jeder Interaktion (Slider, Buttons, st.rerun) neu aus.
+# Damit FRED, Yahoo und die CSV-Dateien nicht jedes Mal erneut abgefragt werden, liegen die Ergebnisse im Cache.
+
+# Liest lokale Umgebungsvariablen ein (.env-Datei muss im Projekt enthalten sein) und holt den API-Key für FRED
+# Nur ein vorhandener Key wird einmal pro Server zwischengespeichert; Ausnahmen cached Streamlit nicht,
+# sodass ein fehlender Key bei jedem Durchlauf erneut gesucht wird (z. B. nach nachträglichem Anlegen der .env)
+@st.cache_resource
+def _cached_fred_api_key():
+    load_dotenv()
+    api_key = os.getenv("FRED_API_KEY")
+    if not api_key:
+        raise KeyError("FRED_API_KEY")
+    return api_key
+
+def _load_fred_api_key():
+    try:
+        return _cached_fred_api_key()
+    except KeyError:
+        return None
+
+# Live-Makrodaten ändern sich höchstens täglich → Cache für eine Stunde
+@st.cache_data(ttl=3600)
+def _cached_macro(fred_api_key):
+    return fetch_live_macro_data(fred_api_key)
+
+# Historische Regime-Klassifikation (statische CSV), indiziert nach Datum für direkte Zeilenzugriffe
+# drop=False: die Spalte Date bleibt für predict_regime erhalten
+@st.cache_data
+def _cached_classification():
+    return load_macro_classification().set_index('Date', drop=False)
+
+# Regime-Modell (Scaler + skalierte historische Daten), wird nur einmal pro Server vorbereitet
+# Bei jedem Neustart des Skripts läuft nur noch der günstige Distanzvergleich (predict_regime)
+@st.cache_resource
+def _cached_regime_model():
+    return fit_regime_model(_cached_classification())
+
+# Zielallokationen je Regime und Strategie (statische CSV)
+@st.cache_data
+def _cached_allocation():
+    return load_asset_allocation()
+
+# Asset-Liste, gruppiert nach Assetklassen: {Klasse: [Ticker, ...]}
+@st.cache_data
+def _cached_assets_by_class():
+    asset_list = load_asset_list()
+    return asset_list.groupby('Class')['Asset'].apply(list).to_dict()
+
+# Historische Kurse über yfinance; tickers muss ein Tupel sein, damit der Cache-Schlüssel hashbar ist
+@st.cache_data(ttl=86400, show_spinner=False)
+def _cached_prices(tickers, start, end):
+    return yf.download(
+        tickers=list(tickers),
+        start=start,
+        end=end,
+        progress=False,
+        group_by='ticker',
+        auto_adjust=False,
+        threads=True
+    )
+
+# CSV-Export eines Portfolios (Spalten Asset, Anteil) als Bytes für den Download-Button
+# Schlüssel sind ID, Ticker und Gewichte als Tupel, damit die CSV nur bei einem neuen Ergebnis neu erzeugt wird
+@st.cache_data
+def _portfolio_csv_bytes(portfolio_id, assets, weights):
+    df = pd.DataFrame({'Asset': assets, 'Anteil': weights})
+    return df.to_csv(index=False).encode('utf-8')
+
+# Plotly-Grafiken werden nur bei geänderten Eingaben neu erstellt; Series und NumPy-Arrays hasht Streamlit selbst
+@st.cache_data(show_spinner=False, max_entries=16)
+def _cached_allocation_pie(allocation):
+    return plot_allocation_pie(allocation)
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def _cached_monte_carlo_plot(simulation_path):
+    return plot_monte_carlo(simulation_path)
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def _cached_portfolio_treemap(portfolio):
+    return plot_portfolio_allocation(portfolio)
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def _cached_asset_averages_plot(columns, asset_averages):
+    return plot_asset_averages(columns, asset_averages)
+
+
+# === Statische HTML-/CSS-Bausteine ===
+# Als Modul-Konstanten definiert, damit die Texte nicht bei jedem Durchlauf neu aufgebaut werden
+
+# CSS zur Vergrößerung der Schrift in der Seitenleiste
+SIDEBAR_CSS = """
+    <style>
+        
+    [data-testid="stSidebar"] .css-1d391kg, [data-testid="stSidebar"] .css-1v3fvcr {
+        font-size: 20px !important;
+    }
+    </style>
+    """
+
+# Einführungstext, der dem Nutzer den Ablauf der App erklärt
+INTRO_HTML = """
+<div style='font-size:16px; line-height:1.6'>
+Diese App unterstützt dich dabei, basierend auf aktuellen makroökonomischen Daten eine passende Anlagestrategie zu wählen und eine intelligente Portfolio-Allokation zu simulieren.
+
+🔍 Du erhältst zu Beginn eine Einschätzung des aktuellen Marktregimes.<br>
+📊 Dann wählst du eine Anlagestrategie oder passt die Allokation individuell an.<br>
+🧪 Anschließend generiert die App 1000 mögliche Portfolios und simuliert deren Entwicklung mit Hilfe einer Monte Carlo Simulation.<br>
+🏆 Am Ende siehst du das beste Portfolio und erhältst Visualisierungen zur Performance.
+
+<br><b>Hinweis:</b> Die App basiert auf historischen Daten und liefert keine Anlageberatung im rechtlichen Sinne.
+</div>
+"""
+
+# Vorlage für die farbige Box mit dem erkannten Marktregime (Platzhalter: regime)
+REGIME_BOX_HTML = """
+        <div style='padding: 1rem; background-color: #1f3d2c; border-radius: 8px; color: white; font-size: 16px; text-align: left;'>
+            📌 <b>Erkanntes Marktregime:</b> <span style="color: #F8EB59;">{regime}</span>
+        </div>
+        """
+
+# Vorlage für einen Eintrag der Liste ähnlicher historischer Perioden (Platzhalter: rank, period, regime, distance)
+PERIOD_ITEM_HTML = "<li><b>Platz {rank}:</b> {period} | Regime: <i>{regime}</i> | Abstand: {distance}</li>"
+
+# Spaltenformat für Allokationstabellen: Werte bleiben numerisch, Streamlit zeigt sie als ganze Prozent an (z. B. "40 %")
+ALLOCATION_COLUMN_CONFIG = {"Wert": st.column_config.NumberColumn(format="%.0f %%")}
+
+
 # === Streamlit Setup ===
 
 # Setzt den Seitentitel und das Layout der App (breit)
@@ -43,17 +171,8 @@ if "simulation_locked" not in st.session_state:
     st.session_state.simulation_locked = False
 
 # Fügt benutzerdefiniertes CSS ein, um die Schriftgröße in der Seitenleiste zu erhöhen
-st.markdown(
-    """
-    <style>
-        
-    [data-testid="stSidebar"] .css-1d391kg, [data-testid="stSidebar"] .css-1v3fvcr {
-        font-size: 20px !important;
-    }
-    </style>
-    """,
-    unsafe_allow_html=True
-)
+# Wird bei jedem Durchlauf erneut ausgegeben: Streamlit entfernt Elemente, die in einem Rerun nicht mehr erzeugt werden
+st.markdown(SIDEBAR_CSS, unsafe_allow_html=True)
 
 # Titel der App mit Icon
 st.title("\U0001F4C8 Intelligenter Portfolio-Simulator")
@@ -62,41 +181,53 @@ st.title("\U0001F4C8 Intelligenter Portfolio-Simulator")
 st.markdown("Willkommen zur interaktiven App für Asset-Allokation und Monte Carlo Simulation.")
 
 # HTML-formatierte Einführung, die dem Nutzer den Ablauf der App erklärt
-st.markdown("""
-<div style='font-size:16px; line-height:1.6'>
-Diese App unterstützt dich dabei, basierend auf aktuellen makroökonomischen Daten eine passende Anlagestrategie zu wählen und eine intelligente Portfolio-Allokation zu simulieren.
-
-🔍 Du erhältst zu Beginn eine Einschätzung des aktuellen Marktregimes.<br>
-📊 Dann wählst du eine Anlagestrategie oder passt die Allokation individuell an.<br>
-🧪 Anschließend generiert die App 1000 mögliche Portfolios und simuliert deren Entwicklung mit Hilfe einer Monte Carlo Simulation.<br>
-🏆 Am Ende siehst du das beste Portfolio und erhältst Visualisierungen zur Performance.
-
-<br><b>Hinweis:</b> Die App basiert auf historischen Daten und liefert keine Anlageberatung im rechtlichen Sinne.
-</div>
-""", unsafe_allow_html=True)
+st.markdown(INTRO_HTML, unsafe_allow_html=True)
 
 # === API-Keys laden ===
 
-# Liest lokale Umgebungsvariablen ein (.env-Datei muss im Projekt enthalten sein)
-load_dotenv()
-
-# Holt API-Key für FRED (Makrodatenanbieter)
-fred_api_key = os.getenv("FRED_API_KEY")
+# Holt den API-Key für FRED (Makrodatenanbieter) aus der Umgebung bzw. der .env-Datei
+fred_api_key = _load_fred_api_key()
 
 # === Live-Makrodaten laden und Regime bestimmen ===
+# Nur der Netzwerkabruf ist abgesichert: HTTP-/Verbindungsfehler (OSError) sowie leere oder unvollständige Antworten,
+# z. B. ein leerer VIX-Download (IndexError/KeyError → LookupError) oder ungültige Werte (ValueError)
+# Fehlgeschlagene Abrufe werden nicht zwischengespeichert, der nächste Durchlauf versucht es erneut
 try:
     # Holt aktuelle Makrodaten (Inflation, Arbeitslosigkeit, Treasury Yields, VIX etc.)
-    live_macro_data = fetch_live_macro_data(fred_api_key)
-
-    # Lädt historische Makroklassifikationen (inkl. manuell zugewiesener Regime-Labels)
-    macro_classification = load_macro_classification()
-
-    # Führt KMeans-Clustering durch und weist aktueller Makrolage ein Regime zu
-    regime, top_periods = classify_market_regime(live_macro_data, macro_classification)
+    live_macro_data = _cached_macro(fred_api_key)
+except (OSError, LookupError, ValueError) as e:
+    if "regime" in st.session_state and "top_distances" in st.session_state:
+        # Regime ist für diese Sitzung bereits bestimmt – nur die Makrotabelle entfällt, die Simulation bleibt nutzbar
+        st.warning("⚠️ Aktuelle Makrodaten konnten nicht geladen werden – es wird das zuvor bestimmte Regime verwendet.")
+        live_macro_data = None
+    else:
+        # Zeigt eine Fehlermeldung mit Stacktrace; ohne Makrodaten kann kein Regime bestimmt werden
+        st.error("❌ Fehler beim Laden der aktuellen Makrodaten.")
+        st.exception(e)
+        st.stop()
+
+# Lädt historische Makroklassifikationen (inkl. manuell zugewiesener Regime-Labels)
+macro_classification = _cached_classification()
+
+# Das Regime wird einmal pro Sitzung bestimmt und danach aus dem Session-State übernommen
+# (bleibt so auch nach Ablauf des Makrodaten-Caches stabil, bis die App zurückgesetzt wird)
+if "regime" in st.session_state and "top_distances" in st.session_state:
+    regime = st.session_state.regime
+    top_periods = st.session_state.top_periods
+    top_distances = st.session_state.top_distances
+else:
+    # Vergleicht die aktuelle Makrolage mit dem (zwischengespeicherten) Regime-Modell und weist ein Regime zu
+    regime, top_periods = predict_regime(_cached_regime_model(), live_macro_data, macro_classification)
+    top_distances = macro_classification.loc[top_periods, 'Distance'].tolist()
+    st.session_state.regime = regime
+    st.session_state.top_periods = top_periods
+    st.session_state.top_distances = top_distances
 
-    # Überschrift zur Darstellung der aktuellen Lage
-    st.markdown("### Aktuelle Makroökonomische Lage")
+# Überschrift zur Darstellung der aktuellen Lage
+st.markdown("### Aktuelle Makroökonomische Lage")
 
+# Makrotabelle nur anzeigen, wenn der Abruf in diesem Durchlauf erfolgreich war
+if live_macro_data is not None:
     # Umbenennung der Spaltennamen für die Anzeige (z. B. Inflation → Inflation %)
     display_macro = live_macro_data.rename(columns={
         'Inflation': 'Inflation (%)',
@@ -108,83 +239,45 @@ try:
         'VIX': 'Volatilitätsindex (VIX)'
     }).T
 
-    # Setzt die neue Spalte zur Anzeige der Werte
+    # Setzt die neue Spalte zur Anzeige der Werte (bleibt numerisch, float64)
     display_macro.columns = ["Wert"]
 
-    # Cast zu String/Objekt, um gemischte Typen zu erlauben (verhindert FutureWarning)
-    display_macro["Wert"] = display_macro["Wert"].round(2).astype("object")
-
-    # Liste der Variablen, die als Prozent dargestellt werden sollen
-    percent_cols = [
-        "Inflation (%)", 
-        "Arbeitslosenquote (%)", 
-        "BIP-Wachstum (%)",
-        "US Treasury 10J (%)",
-        "US Treasury 2J (%)"
-    ]
-
-    # Wandelt numerische Werte in Prozentstrings um (z. B. 2.34 → "2.34%")
-    display_macro.loc[percent_cols, "Wert"] = display_macro.loc[percent_cols, "Wert"].map(lambda x: f"{x:.2f}%")
-    
-    # ❗ Letzter Schritt – ALLES als String casten für Arrow-Kompatibilität:
-    display_macro["Wert"] = display_macro["Wert"].astype(str)
-
     # Setzt Achsentitel für die Anzeige
     display_macro.index.name = "Bezeichnung"
-    
-    # Zeigt Tabelle mit den aktuellen Makrowerten an
-    st.table(display_macro)
 
-    # Hebt das aktuell erkannte Marktregime in einer farbigen Box hervor
-    st.markdown(
-        f"""
-        <div style='padding: 1rem; background-color: #1f3d2c; border-radius: 8px; color: white; font-size: 16px; text-align: left;'>
-            📌 <b>Erkanntes Marktregime:</b> <span style="color: #F8EB59;">{regime}</span>
-        </div>
-        """,
-        unsafe_allow_html=True
+    # Zeigt Tabelle mit den aktuellen Makrowerten an
+    # Formatierung auf 2 Nachkommastellen übernimmt Streamlit; Prozentwerte sind an "(%)" im Namen erkennbar
+    st.dataframe(
+        display_macro,
+        column_config={"Wert": st.column_config.NumberColumn(format="%.2f")}
     )
-    
-    # Überschrift zur Anzeige der historisch ähnlichsten Zeiträume
-    st.markdown("### 🗓 Ähnlichste historische Perioden zum aktuellen Regime:")
-
-    # Erstellt eine HTML-Liste, um die Top 3 ähnlichen historischen Perioden zu formatieren
-    html_list = "<ul style='line-height: 1.9; margin-top: 0.5rem;'>"
 
-    # Iteriert über die Liste der ähnlichsten Zeiträume, die vom Klassifikator zurückgegeben wurden
-    for i, period in enumerate(top_periods, 1):
-        # Holt die Zeile aus dem Klassifikations-Datensatz, die zum Periodenzeitpunkt gehört
-        row = macro_classification[macro_classification['Date'] == period].iloc[0]
+# Hebt das aktuell erkannte Marktregime in einer farbigen Box hervor
+st.markdown(REGIME_BOX_HTML.format(regime=regime), unsafe_allow_html=True)
 
-        # Extrahiert den Distanzwert zwischen aktuellem Zustand und diesem Zeitraum
-        distance = row.get('Distance', None)
+# Überschrift zur Anzeige der historisch ähnlichsten Zeiträume
+st.markdown("### 🗓 Ähnlichste historische Perioden zum aktuellen Regime:")
 
-        # Formatiert die Distanz als String oder zeigt N/A, falls nicht vorhanden
-        distance_str = f"{distance:.4f}" if isinstance(distance, float) else "N/A"
+# Holt die Regime aller ähnlichsten Zeiträume in einem Schritt über den Datums-Index
+top_regimes = macro_classification.reindex(top_periods)["Regime"]
 
-        # Holt das zugeordnete Regime aus der Zeile
-        regime_text = row['Regime']
-
-        # Fügt einen Listeneintrag zur HTML-Liste hinzu
-        html_list += f"<li><b>Platz {i}:</b> {period} | Regime: <i>{regime_text}</i> | Abstand: {distance_str}</li>"
-
-    # Schliesst die HTML-Liste ab
-    html_list += "</ul>"
+# Erstellt je Zeitraum einen Listeneintrag mit Regime und Distanz zum aktuellen Zustand
+# Die Distanz wird als String formatiert oder als N/A angezeigt, falls nicht vorhanden
+list_items = [
+    PERIOD_ITEM_HTML.format(
+        rank=i,
+        period=period,
+        regime=period_regime,
+        distance=f"{distance:.4f}" if isinstance(distance, float) else "N/A"
+    )
+    for i, (period, period_regime, distance) in enumerate(zip(top_periods, top_regimes, top_distances), 1)
+]
 
-    # Zeigt die HTML-Liste in der App an
-    st.markdown(html_list, unsafe_allow_html=True)
+# Erstellt die HTML-Liste mit den Top 3 ähnlichen historischen Perioden
+html_list = "<ul style='line-height: 1.9; margin-top: 0.5rem;'>" + "".join(list_items) + "</ul>"
 
-# === Fehlerbehandlung für Makro-Klassifikation oder Datenabruf ===
-except Exception as e:
-    # Zeigt eine Fehlermeldung bei Ausnahme
-    st.error("❌ Fehler beim Laden oder Verarbeiten der Daten.")
-    # Gibt die Exception mit Stacktrace aus
-    st.exception(e)
-    
-    # Trennt den Abschnitt visuell
-    st.markdown("---")
-    # Setzt Titel für den nächsten Abschnitt: Strategieauswahl
-    st.markdown("### \U0001F3AF Anlagestrategie")
+# Zeigt die HTML-Liste in der App an
+st.markdown(html_list, unsafe_allow_html=True)
 
 # === Initialisiere Session-State erneut, falls nötig ===
 if "strategy_locked" not in st.session_state:
@@ -221,7 +314,7 @@ else:
     use_custom = st.session_state.get("use_custom", False)
 
 # === Empfehlung laden anhand Regime & Strategie ===
-asset_allocation_df = load_asset_allocation()
+asset_allocation_df = _cached_allocation()
 
 # Filtert passende Allokation für erkannte Regime-Strategie-Kombination
 recommended_allocation = asset_allocation_df[
@@ -233,39 +326,33 @@ recommended_allocation = asset_allocation_df[
 st.markdown("### 🧮 Empfohlene Asset-Allokation")
 
 # Bereitet Daten für Tabellenanzeige auf
-display_allocation = recommended_allocation.rename_axis("Bezeichnung").rename("Wert").to_frame()
-display_allocation["Wert"] = display_allocation["Wert"].map(lambda x: f"{x:.0f} %")
+display_allocation = recommended_allocation.astype(float).rename_axis("Bezeichnung").rename("Wert").to_frame()
 
-# Zeigt die Tabelle in der App
-st.table(display_allocation)
+# Zeigt die Tabelle in der App (Formatierung als Prozent übernimmt Streamlit)
+st.dataframe(display_allocation, column_config=ALLOCATION_COLUMN_CONFIG)
 
 # === Optional: Benutzerdefinierte Allokation aktivieren ===
 allocation_valid = True
 if use_custom and not st.session_state.strategy_locked:
     st.sidebar.markdown("### 🛠 Benutzerdefinierte Allokation")
 
-    # Initialisiert Wörterbuch und Zähler
-    custom_allocation = {}
-    total = 0
-
-    # Erstelle Slider pro Assetklasse
-    for asset_class in recommended_allocation.index:
-        val = st.sidebar.slider(
-            f"{asset_class} (%)", 0, 100,
-            int(recommended_allocation[asset_class]),
-            key=f"slider_{asset_class}"
-        )
-        custom_allocation[asset_class] = val
-        total += val
+    # Ein einziges editierbares Tabellen-Widget für alle Assetklassen (statt eines Sliders pro Klasse)
+    # Startwerte sind die empfohlenen Gewichte in ganzen Prozent
+    allocation_df = recommended_allocation.astype(int).rename_axis("Assetklasse").rename("Wert").to_frame()
+    edited_allocation = st.sidebar.data_editor(
+        allocation_df,
+        column_config={"Wert": st.column_config.NumberColumn("Wert (%)", min_value=0, max_value=100, step=1)},
+        key="alloc_editor"
+    )
 
-    # Konvertiert in Series
-    current_allocation = pd.Series(custom_allocation)
+    # Übernimmt die bearbeiteten Werte als Series (geleerte Zellen zählen als 0 %)
+    current_allocation = edited_allocation["Wert"].fillna(0).astype(int)
+    total = int(current_allocation.sum())
 
     # Anzeige der benutzerdefinierten Allokation
     st.markdown("### 📊 Eigene Asset-Allokation")
-    display_custom = current_allocation.rename_axis("Bezeichnung").rename("Wert").to_frame()
-    display_custom["Wert"] = display_custom["Wert"].map(lambda x: f"{x:.0f} %")
-    st.table(display_custom)
+    display_custom = current_allocation.astype(float).rename_axis("Bezeichnung").rename("Wert").to_frame()
+    st.dataframe(display_custom, column_config=ALLOCATION_COLUMN_CONFIG)
 
     # Validierung: Summe muss genau 100 % ergeben
     if total != 100:
@@ -290,7 +377,7 @@ if allocation_valid:
 
     # Linke Spalte: Kreisdiagramm (Pie Chart)
     with col1:
-        fig = plot_allocation_pie(current_allocation)
+        fig = _cached_allocation_pie(current_allocation)
         st.plotly_chart(fig, use_container_width=True)
 
     # Rechte Spalte: Farbliche Legende der Kategorien
@@ -320,9 +407,8 @@ if not st.session_state.strategy_locked:
     if allocation_valid and start_simulation:
         with st.spinner("Generiere Portfolios basierend auf deiner Allokation..."):
 
-            # Holt Assetliste und gruppiert nach Assetklassen
-            asset_list = load_asset_list()
-            assets_by_class = asset_list.groupby('Class')['Asset'].apply(list).to_dict()
+            # Holt Assetliste gruppiert nach Assetklassen (aus dem Cache)
+            assets_by_class = _cached_assets_by_class()
 
             # Erstellt 1000 Portfolios mit Zufallsgewichtung innerhalb der Klassen
             portfolios = generate_portfolios(current_allocation, assets_by_class, num_portfolios=num_portfolios_input)
@@ -342,7 +428,11 @@ if not st.session_state.strategy_locked:
                 # Reset relevanter Simulationsdaten
                 st.session_state.sim_result_df = None
                 st.session_state.asset_averages = None
+                st.session_state.simulated_assets = None
                 st.session_state.best_portfolio_id = None
+                st.session_state.prices_np = None
+                st.session_state.weights_np = None
+                st.session_state.common_assets = None
 
                 # Löst App-Neustart aus, um nahtlos in Simulationsabschnitt zu wechseln
                 st.rerun()
@@ -367,47 +457,74 @@ try:
     # Liste aller Assets im Portfolio
     assets = portfolios.columns.tolist()
 
-    # Leerer DataFrame zur Aufnahme aller Preisverläufe
-    price_data_all = pd.DataFrame()
-
-    # Schleife über alle ähnlichen Perioden (z. B. Top 3 aus Regime-Vergleich)
-    for period in top_periods:
-        start_date = datetime.strptime(period, "%Y-%m-%d")
-        end_date = start_date + timedelta(days=365)
-
-        # Lade Daten über yfinance (mehrere Ticker gleichzeitig)
-        try:
-            data = yf.download(
-                tickers=assets,
-                start=start_date.strftime("%Y-%m-%d"),
-                end=end_date.strftime("%Y-%m-%d"),
-                progress=False,
-                group_by='ticker',
-                auto_adjust=False
+    # Leere Preistabelle als Rückfall, falls der Abruf fehlschlägt
+    adj_close = pd.DataFrame(index=pd.DatetimeIndex([]))
+
+    # Zeitfenster je ähnlicher Periode (z. B. Top 3 aus Regime-Vergleich): ab Startdatum ein Jahr
+    # Alle Startdaten werden in einem Schritt in Zeitstempel umgewandelt (yfinance akzeptiert diese direkt)
+    starts = pd.to_datetime(top_periods, format="%Y-%m-%d")
+    ends = starts + pd.Timedelta(days=365)
+
+    # Lade Daten über yfinance in einem einzigen Abruf über den gesamten Zeitraum aller Perioden
+    # (ein HTTP-Durchlauf statt einem pro Periode), die Perioden werden danach im Speicher ausgeschnitten
+    try:
+        data = _cached_prices(tuple(assets), starts.min(), ends.max())
+
+        # Datenstruktur anpassen
+        # Bei group_by='ticker' lauten die Spalten (Ticker, Feld) → "Adj Close" aller Ticker in einem Schritt auswählen;
+        # nicht gelieferte Ticker ergeben durch reindex reine NaN-Spalten und werden anschließend entfernt
+        if isinstance(data.columns, pd.MultiIndex):
+            adj_close = (
+                data.xs("Adj Close", axis=1, level=1)
+                .reindex(columns=assets)
+                .dropna(axis=1, how='all')
             )
-
-            # Datenstruktur anpassen
-            if isinstance(data.columns, pd.MultiIndex):
-                adj_close = pd.DataFrame({
-                    t: data[t]["Adj Close"]
-                    for t in assets if (t in data.columns.get_level_values(0))
-                })
-            else:
-                adj_close = data["Adj Close"].to_frame() if "Adj Close" in data.columns else data
-
-            adj_close.index = pd.to_datetime(adj_close.index)
-            price_data_all = pd.concat([price_data_all, adj_close])
-
-        except Exception as e:
-            st.warning(f"⚠️ Fehler beim Abrufen der Daten für Zeitraum {period}: {e}")
-            continue
-
-    # Duplikate im Index entfernen
-    price_data_all = price_data_all[~price_data_all.index.duplicated(keep='first')]
-
-    # Schnittmenge der Assets mit dem Portfolio
-    common_assets = price_data_all.columns.intersection(portfolios.columns)
-    price_data_all = price_data_all[common_assets]
+        else:
+            adj_close = data["Adj Close"].to_frame() if "Adj Close" in data.columns else data
+
+        adj_close.index = pd.to_datetime(adj_close.index)
+        adj_close = adj_close.sort_index()
+
+    except Exception as e:
+        st.warning(f"⚠️ Fehler beim Abrufen der Daten für die Zeiträume {', '.join(top_periods)}: {e}")
+
+    # Markiert alle Handelstage, die in mindestens einem Jahresfenster liegen (Enddatum exklusiv wie bei yfinance)
+    # Entspricht dem Aneinanderhängen der Perioden mit anschließendem Entfernen doppelter Tage (überlappende Perioden),
+    # ohne einen DataFrame je Periode auszuschneiden
+    dates = adj_close.index
+    in_window = np.zeros(len(dates), dtype=bool)
+    for start_date, end_date in zip(starts, ends):
+        in_window |= (dates >= start_date) & (dates < end_date)
+
+    # Einmalige Umwandlung in zusammenhängende float32-Arrays für Simulation und Bewertung
+    # (Zeitpunkte x Assets bzw. Portfolios x Assets, Spalten in der Reihenfolge von common_assets)
+    # Die Preismatrix wird in einem vorab angelegten Puffer gefüllt, dessen Größe durch die Maske bekannt ist;
+    # kopiert werden nur die zusammenhängenden Tagesblöcke der Maske, nicht der gesamte Downloadzeitraum
+    # Die Arrays bleiben samt zugehöriger Asset-Liste im Session-State, bis neue Portfolios generiert werden
+    if st.session_state.get("prices_np") is None:
+        # Schnittmenge der Assets mit dem Portfolio
+        common_assets = adj_close.columns.intersection(portfolios.columns)
+
+        # Nach einem fehlgeschlagenen Download (leerer Ersatz-Frame) wird nichts gespeichert,
+        # damit der nächste Durchlauf die Preise erneut lädt, statt mit einer leeren Matrix zu simulieren
+        if common_assets.empty or not in_window.any():
+            st.error("❌ Keine Preisdaten für die Portfolio-Assets verfügbar – bitte die App erneut ausführen.")
+            st.stop()
+
+        st.session_state.common_assets = common_assets
+        prices_np = np.empty((int(in_window.sum()), len(common_assets)), dtype=np.float32)
+        asset_pos = adj_close.columns.get_indexer(common_assets)
+        # Anfang und Ende (exklusiv) jedes zusammenhängenden Blocks markierter Tage
+        bounds = np.flatnonzero(np.diff(np.concatenate(([0], in_window.view(np.int8), [0]))))
+        row = 0
+        for block_start, block_end in zip(bounds[::2], bounds[1::2]):
+            prices_np[row:row + block_end - block_start] = adj_close.iloc[block_start:block_end, asset_pos].to_numpy()
+            row += block_end - block_start
+        st.session_state.prices_np = prices_np
+        st.session_state.weights_np = np.ascontiguousarray(portfolios[common_assets].to_numpy(dtype=np.float32))
+    common_assets = st.session_state.common_assets
+    prices_np = st.session_state.prices_np
+    weights_np = st.session_state.weights_np
     portfolios = portfolios[common_assets].copy()
 
     st.success("\U0001F4C8 Reale Preisdaten erfolgreich geladen und abgestimmt.")
@@ -446,14 +563,23 @@ try:
     # Wenn Simulation gestartet wurde
     if start_mc_sim:
         with st.spinner("Monte Carlo Simulation läuft... bitte einen Moment Geduld..."):
-            # Führt Monte Carlo Simulation durch
-            asset_avg_paths = run_monte_carlo(
-                price_data_all,
+            # Führt Monte Carlo Simulation durch (Preis-Array muss zeilenweise zusammenhängend sein, s. o.)
+            assert prices_np.flags['C_CONTIGUOUS']
+            # Übergeben wird nur das NumPy-Array; der Numba-Kernel gibt währenddessen den GIL frei,
+            # sodass Streamlit-Server und andere Sitzungen reaktionsfähig bleiben
+            positions, asset_avg_paths = simulate_prices(
+                prices_np,
                 num_simulations=temp_simulations
             )
+            simulated_assets = common_assets[positions].tolist()
 
-            # Bewertet alle Portfolios anhand der simulierten Pfade
-            analyzed_df, best_portfolio_id, best_simulation_path = analyze_simulation_results(asset_avg_paths, portfolios)
+            # Bewertet alle Portfolios anhand der simulierten Pfade (Gewichte der simulierten Assets)
+            analyzed_df, best_portfolio_id, best_simulation_path = analyze_simulation_results(
+                simulated_assets, asset_avg_paths, weights_np[:, positions]
+            )
+
+            # Portfolio-ID als Kategorie: Gruppierungen in der Ergebnisanzeige arbeiten so auf Integer-Codes
+            analyzed_df["portfolio_id"] = analyzed_df["portfolio_id"].astype("category")
 
             # Speichert Ergebnisse im Session-State
             st.session_state.simulation_locked = True
@@ -463,6 +589,7 @@ try:
             st.session_state.best_portfolio_id = best_portfolio_id
             st.session_state.best_simulation_path = best_simulation_path
             st.session_state.asset_averages = asset_avg_paths
+            st.session_state.simulated_assets = simulated_assets
 
             # Löst Neustart der App aus für Visualisierungsteil
             st.rerun()
@@ -473,38 +600,39 @@ try:
         for key in [
             "strategy_locked", "simulation_started", "strategie", "num_portfolios",
             "use_custom", "portfolios", "current_allocation", "sim_result_df",
-            "asset_averages", "best_portfolio_id", "top_periods", "regime",
+            "asset_averages", "simulated_assets", "best_portfolio_id", "top_periods", "regime", "top_distances",
+            "prices_np", "weights_np", "common_assets",
             "simulation_locked", "simulation_done", "n_simulations"
         ]:
             st.session_state.pop(key, None)
         st.rerun()
 
     # === Anzeige der Simulationsergebnisse ===
-    if "simulation_done" in st.session_state and st.session_state.simulation_done:
+    # Als Fragment: Interaktionen innerhalb der Ergebnisse (z. B. der Download-Button) führen nur diesen Abschnitt
+    # neu aus statt des gesamten Skripts (Makrodaten, Allokation, Preisabgleich)
+    @st.fragment
+    def show_simulation_results():
         # Holt relevante Ergebnisse aus dem Session-State
         analyzed_df = st.session_state.sim_result_df
         best_portfolio_id = st.session_state.best_portfolio_id
         asset_averages = st.session_state.asset_averages
+        simulated_assets = st.session_state.simulated_assets
 
         st.success("✅ Portfolios wurden erfolgreich simuliert.")
 
         # 1. Bestimme Top-5 Portfolios anhand des finalen Scores
         top5_ids = (
-            analyzed_df.groupby("portfolio_id")["final_score"]
+            analyzed_df.groupby("portfolio_id", observed=True)["final_score"]
             .mean()
-            .sort_values(ascending=False)
-            .head(5)
+            .nlargest(5)
             .index.tolist()
         )
 
-        # 2. Hole beste Simulation pro Portfolio-ID
-        best_simulations = (
-            analyzed_df[analyzed_df["portfolio_id"].isin(top5_ids)]
-            .sort_values("final_score", ascending=False)
-            .groupby("portfolio_id")
-            .first()
-            .reset_index()
-        )
+        # 2. Hole beste Simulation pro Portfolio-ID (Zeile mit maximalem Score je ID, ohne vorherige Sortierung)
+        top5_df = analyzed_df[analyzed_df["portfolio_id"].isin(pd.Index(top5_ids))]
+        best_simulations = top5_df.loc[
+            top5_df.groupby("portfolio_id", observed=True)["final_score"].idxmax()
+        ].reset_index(drop=True)
 
         # 3. Sortiere Ergebnisse und ergänze "Rating" als Rangfolge
         best_simulations = best_simulations.sort_values("final_score", ascending=False).reset_index(drop=True)
@@ -539,12 +667,14 @@ try:
             # Hole Portfolio
             best_portfolio = portfolios.loc[best_portfolio_id]
 
-            # Konvertiere in DataFrame für CSV-Export
-            best_df = best_portfolio.reset_index()
-            best_df.columns = ['Asset', 'Anteil']
+            # Erzeuge CSV-Export (aus dem Cache, solange sich das beste Portfolio nicht ändert)
+            csv = _portfolio_csv_bytes(
+                best_portfolio_id,
+                tuple(best_portfolio.index),
+                tuple(best_portfolio.values)
+            )
 
             # Biete Downloadbutton an
-            csv = best_df.to_csv(index=False).encode('utf-8')
             st.download_button(
                 label="📥 Beste Portfolioallokation als CSV herunterladen",
                 data=csv,
@@ -554,7 +684,7 @@ try:
 
             try:
                 # Visualisierung 1: Monte Carlo Pfad
-                fig1 = plot_monte_carlo(st.session_state.best_simulation_path)
+                fig1 = _cached_monte_carlo_plot(st.session_state.best_simulation_path)
                 if fig1:
                     st.plotly_chart(fig1, use_container_width=True)
                 else:
@@ -562,18 +692,21 @@ try:
 
                 # Visualisierung 2: Treemap der Portfolio-Zusammensetzung
                 st.markdown("### 🧭 Verteilung des besten Portfolios")
-                fig2 = plot_portfolio_allocation(best_portfolio)
+                fig2 = _cached_portfolio_treemap(best_portfolio)
                 st.plotly_chart(fig2, use_container_width=True)
 
                 # Visualisierung 3: Durchschnittliche Assetpfade über alle Simulationen
                 st.markdown("### 📈 Durchschnittliche Entwicklung pro Asset (Simulation)")
-                fig3 = plot_asset_averages(asset_averages)
+                fig3 = _cached_asset_averages_plot(simulated_assets, asset_averages)
                 st.plotly_chart(fig3, use_container_width=True)
 
             except Exception as e:
                 st.error("⚠️ Fehler bei der Visualisierung.")
                 st.exception(e)
 
+    if st.session_state.get("simulation_done", False):
+        show_simulation_results()
+
 # === Fehlerbehandlung für Gesamtsimulation ===
 except Exception as e:
     st.error("❌ Fehler während der Vorbereitung der Simulation.")